@@ -1,18 +1,39 @@
 import os
 import time
 import json
+import queue
+import collections
+import selectors
 import subprocess
 import threading
 import requests
 import hashlib
 import logging
-import re
+import dbm
 import shutil
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+from watchdog.events import (
+    FileSystemEventHandler, FileClosedEvent, FileCreatedEvent, FileMovedEvent,
+    DirCreatedEvent, DirMovedEvent
+)
+from watchdog.utils import platform
 from dotenv import load_dotenv
 
+try:
+    from blake3 import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    from progress_parse import parse_progress as _parse_progress  # optional Cython build
+except ImportError:
+    _parse_progress = None
+
 load_dotenv()
 
 # ===================================================
@@ -21,22 +42,82 @@ load_dotenv()
 INPUT_DIR = "input"
 OUTPUT_DIR = "output"
 TASKS_FILE = "conf/tasks.json"
+TASKS_LOG = "conf/tasks.jsonl"
+HASH_CACHE_FILE = "conf/hash_cache.db"
 NTFY_BASE_URL = os.getenv("NTFY_BASE_URL")
 NTFY_TOPIC = f"{NTFY_BASE_URL}/video-compressor"
 
 VIDEO_EXT = {".mp4", ".mkv", ".mov", ".avi", ".webm"}
+_VIDEO_SUFFIXES = tuple(VIDEO_EXT)  # str.endswith accepts a tuple
+_INPUT_PREFIX = INPUT_DIR + os.sep
 PROFILE = "medium"
 CHECK_INTERVAL = 4
+HASH_WINDOW = 65536  # Bytes hashed from the head and tail of each file
+PROGRESS_INTERVAL = 0.25  # Minimum seconds between progress line updates
+STALL_TIMEOUT = 30  # Seconds without ffmpeg progress before a warning is logged
+DEBOUNCE_MS = int(os.getenv("DEBOUNCE_MS", "500"))  # Quiet time before a watched file is queued
+# Task journal fsync batching (keep the batch modest to bound latency)
+FSYNC_INTERVAL_MS = int(os.getenv("TASKSTORE_FSYNC_INTERVAL_MS", "200"))
+FSYNC_BATCH = 32
+# Parallel wait+hash workers. More writers than this just contend on the device
+HASH_WORKERS = min(8, os.cpu_count() or 1)
+
+# inotify reports IN_CLOSE_WRITE, so a file can be picked up as soon as its writer
+# closes it. Elsewhere we fall back to polling the file size until it settles.
+CLOSE_EVENTS = platform.is_linux()
+CLOSE_SETTLE = 1.0  # Seconds a closed file must stay unchanged (writers may reopen it)
+CREATE_FALLBACK = 10  # Seconds a created file may go without a close or a write before it is polled
 
 # Resolution folders
 RESOLUTION_FOLDERS = ["480", "720", "1080"]
+_RES_PREFIXES = tuple(f"{r}{os.sep}" for r in RESOLUTION_FOLDERS)
 
 ROTATION_THRESHOLD = 100  # Minimum entries before rotation is considered
 ROTATION_SCAN_WAIT = 5     # Number of scan cycles to wait before rotating
 rotation_scan_counter = 0  # Track scan cycles
 
-# Lock to prevent threads from corrupting the JSON file
-data_lock = threading.Lock()
+# Statuses the processor picks tasks up from
+QUEUED_STATUSES = ("queued", "waiting_for_resolution")
+
+class RWLock:
+    """
+    Readers-preferred read/write lock. Any number of readers share it,
+    a writer holds it alone.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+# Guards the task store: lookups and snapshots share it, mutations are exclusive
+data_lock = RWLock()
 
 X265_PROFILES = {
     "slow": {
@@ -73,8 +154,14 @@ logger = logging.getLogger(__name__)
 # ===================================================
 # UTILITIES
 # ===================================================
+@lru_cache(maxsize=1)
+def _utc_second(second):
+    """ "YYYY-MM-DDTHH:MM:SS" for a Unix second; a burst within one second formats once """
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+
 def now():
-    return datetime.utcnow().isoformat()
+    second, ns = divmod(time.time_ns(), 1_000_000_000)
+    return f"{_utc_second(second)}.{ns // 1000:06d}"
 
 def file_size(path):
     try:
@@ -82,73 +169,489 @@ def file_size(path):
     except OSError:
         return 0
 
+# One keep-alive session so notifications reuse the connection
+_ntfy_session = requests.Session()
+_ntfy_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4,
+                            max_retries=Retry(total=2, backoff_factor=0.2))
+_ntfy_session.mount("https://", _ntfy_adapter)
+_ntfy_session.mount("http://", _ntfy_adapter)
+_ntfy_queue = queue.Queue()
+
 def send_ntfy(msg):
-    try:
-        requests.post(
-            f"{NTFY_TOPIC}",
-            data=msg.encode("utf-8"),
-            headers={"Content-Type": "text/plain; charset=utf-8"},
-            timeout=5
-        )
-    except Exception as e:
-        logger.error(f"Failed to send notification: {e}")
+    """ Queues a notification; it is posted by the ntfy worker thread """
+    _ntfy_queue.put(msg)
 
-def load_tasks():
-    with data_lock:
-        if not os.path.exists(TASKS_FILE):
-            return []
+def _ntfy_worker():
+    while True:
+        msg = _ntfy_queue.get()
         try:
-            with open(TASKS_FILE, "r") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, OSError):
-            logger.error("JSON file corrupted or unreadable. Returning empty list.")
-            return []
-
-def save_tasks(tasks):
-    with data_lock:
-        os.makedirs(os.path.dirname(TASKS_FILE), exist_ok=True)
-        temp_file = TASKS_FILE + ".tmp"
+            _ntfy_session.post(
+                f"{NTFY_TOPIC}",
+                data=msg.encode("utf-8"),
+                headers={"Content-Type": "text/plain; charset=utf-8"},
+                timeout=5
+            )
+        except Exception as e:
+            logger.error(f"Failed to send notification: {e}")
+
+_HASH_NAME = "blake3" if blake3 else "blake2b"
+
+class HashCache:
+    """
+    Persistent fast_hash memo: (device, inode) -> (algorithm, size, mtime_ns, digest)
+    in a dbm file, with an in-memory dict in front. A row whose size or mtime_ns
+    disagrees with the live stat is stale and gets recomputed.
+    """
+    def __init__(self, path):
+        self._mem = {}
+        self._lock = threading.Lock()
         try:
-            with open(temp_file, "w") as f:
-                json.dump(tasks, f, indent=4)
-            # Atomic move prevents corruption if power fails during write
-            os.replace(temp_file, TASKS_FILE)
-        except OSError as e:
-            logger.error(f"Failed to save tasks: {e}")
+            self._db = dbm.open(path, "c")
+        except Exception as e:
+            logger.warning(f"Hash cache unavailable, hashing without it: {e}")
+            self._db = None
+
+    def get(self, st):
+        key = f"{st.st_dev}:{st.st_ino}"
+        with self._lock:
+            value = self._mem.get(key)
+            if value is None and self._db is not None:
+                raw = self._db.get(key)
+                value = raw.decode() if raw else None
+        if not value:
+            return None
+        name, size, mtime_ns, digest = value.split(":")
+        if name != _HASH_NAME or int(size) != st.st_size or int(mtime_ns) != st.st_mtime_ns:
+            return None
+        return digest
+
+    def put(self, st, digest):
+        key = f"{st.st_dev}:{st.st_ino}"
+        value = f"{_HASH_NAME}:{st.st_size}:{st.st_mtime_ns}:{digest}"
+        with self._lock:
+            self._mem[key] = value
+            if self._db is not None:
+                self._db[key] = value
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+hash_cache = None
+
+_hash_local = threading.local()
+
+def _hash_buffer():
+    """ This thread's HASH_WINDOW read buffer, allocated once """
+    buf = getattr(_hash_local, "buf", None)
+    if buf is None:
+        buf = _hash_local.buf = bytearray(HASH_WINDOW)
+    return buf
 
 def fast_hash(path):
-    """ Hashes first 64KB, last 64KB and file size for speed """
+    """
+    Hashes first 64KB and last 64KB, keyed by the file size, for speed.
+    Uses BLAKE3 when the wheel is installed, BLAKE2b otherwise.
+    Results are memoized in hash_cache, so unchanged files are never re-read.
+    """
     try:
-        h = hashlib.md5()
-        size = os.path.getsize(path)
-        with open(path, "rb") as f:
-            # Read first 64KB
-            chunk = f.read(65536)
-            h.update(chunk)
-            # Jump to end - 64KB
-            if size > 131072:
-                f.seek(-65536, os.SEEK_END)
-                chunk = f.read(65536)
-                h.update(chunk)
-        h.update(str(size).encode())
-        return h.hexdigest()
+        st = os.stat(path)
+        if hash_cache:
+            digest = hash_cache.get(st)
+            if digest:
+                return digest
+
+        size = st.st_size
+        key = size.to_bytes(32, "little")
+        if blake3:
+            h = blake3(key=key, max_threads=1)
+        else:
+            h = hashlib.blake2b(key=key, digest_size=32)
+        # Read into a reused buffer, no intermediate bytes objects. Unlike an mmap,
+        # a file truncated meanwhile just gives short reads instead of SIGBUS.
+        view = memoryview(_hash_buffer())
+        with open(path, "rb", buffering=0) as f:
+            # First 64KB
+            n = f.readinto(view)
+            h.update(view[:n])
+            # Last 64KB
+            if size > 2 * HASH_WINDOW:
+                f.seek(size - HASH_WINDOW)
+                n = f.readinto(view)
+                h.update(view[:n])
+        digest = h.hexdigest()
+
+        if hash_cache:
+            hash_cache.put(st, digest)
+        return digest
     except Exception:
         return ""
 
+def _hash_cached(path):
+    """ True if hash_cache already holds the digest of path's current contents """
+    try:
+        return bool(hash_cache and hash_cache.get(os.stat(path)))
+    except OSError:
+        return False
+
+def prefetch_hash_windows(paths):
+    """
+    Asks the kernel to read the hashed head/tail windows of every file up front,
+    so the reads for a whole batch are in flight together instead of being
+    serviced one file at a time by fast_hash. No-op where posix_fadvise is missing.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            size = os.fstat(fd).st_size
+            os.posix_fadvise(fd, 0, HASH_WINDOW, os.POSIX_FADV_WILLNEED)
+            if size > 2 * HASH_WINDOW:
+                os.posix_fadvise(fd, size - HASH_WINDOW, HASH_WINDOW, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+_probe_cache = {}  # (path, mtime_ns) -> media info
+
+def _rotation(stream):
+    """ Rotation in degrees from the display matrix side data, else the legacy rotate tag """
+    for side_data in stream.get("side_data_list", []):
+        if "rotation" in side_data:
+            return int(float(side_data["rotation"]))
+    try:
+        return int(float(stream.get("tags", {}).get("rotate", 0)))
+    except ValueError:
+        return 0
+
+def _probe_media(path):
+    """
+    Returns {"duration", "display_height", "audio_codec"} for a video with one
+    ffprobe call, memoized per (path, mtime_ns). Unknown values are 0 / None.
+    display_height is the height after rotation, as ffmpeg autorotates before -vf.
+    """
+    media = {"duration": 0, "display_height": 0, "audio_codec": None}
+    try:
+        key = (path, os.stat(path).st_mtime_ns)
+    except OSError:
+        return media
+    if key in _probe_cache:
+        return _probe_cache[key]
+
+    try:
+        probe = subprocess.check_output(
+            ["ffprobe", "-v", "error",
+             "-show_entries", "stream=codec_type,codec_name,width,height,duration"
+                              ":stream_tags=rotate:stream_side_data=rotation:format=duration",
+             "-of", "json", path]
+        )
+        info = json.loads(probe)
+    except Exception as e:
+        logger.warning(f"Could not probe media info: {e}")
+        return media
+
+    streams = info.get("streams", [])
+    video = next((st for st in streams if st.get("codec_type") == "video"), {})
+    audio = next((st for st in streams if st.get("codec_type") == "audio"), {})
+    # Portrait phone clips are stored landscape with a ±90° rotation
+    if _rotation(video) % 180 == 90:
+        media["display_height"] = video.get("width") or 0
+    else:
+        media["display_height"] = video.get("height") or 0
+    media["audio_codec"] = audio.get("codec_name")
+    # Matroska often has no per-stream duration, so fall back to the container's
+    for value in (video.get("duration"), info.get("format", {}).get("duration")):
+        if value and value != "N/A":
+            media["duration"] = float(value)
+            break
+
+    _probe_cache[key] = media
+    return media
+
 def detect_resolution_from_path(rel_path):
     """
     Detects resolution from folder structure.
     Expected structure: input/480/video.mp4 or input/720/subfolder/video.mp4
     Returns resolution string (480, 720, 1080) or None if not in a resolution folder
     """
-    parts = rel_path.split(os.sep)
-    
     # Check if the first folder is a resolution folder
-    if len(parts) > 0 and parts[0] in RESOLUTION_FOLDERS:
-        return parts[0]
+    for prefix, resolution in zip(_RES_PREFIXES, RESOLUTION_FOLDERS):
+        if rel_path.startswith(prefix):
+            return resolution
     
     return None
 
+# ===================================================
+# TASK STORE
+# ===================================================
+class TaskStore:
+    """
+    In-memory task table backed by an append-only JSONL journal, indexed by
+    path and by content hash ("md5") so lookups and dedup are O(1).
+    Every mutation appends a single {"op": "add"|"update", "path", "fields"}
+    record instead of rewriting the whole task list. Updates may carry the
+    "md5" of the task they were meant for and are dropped if the path has been
+    re-added with other content since. An add never replaces a task that is
+    processing; it is held until that encode ends. A finished task replaced by
+    a re-add is retired: it stays in the snapshot and the hash index until
+    rotation archives it. The journal is replayed on startup and compacted
+    whenever it is rewritten from the snapshot.
+    Writers only write(); a flusher thread fsyncs every FSYNC_INTERVAL_MS or
+    once FSYNC_BATCH records are pending, whichever comes first.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._by_path = {}
+        self._by_hash = {}
+        self._queue = collections.deque()  # Paths in processing order, may hold stale entries
+        self._held = {}  # path -> task re-added while the old content was processing
+        self._retired = []  # Finished tasks whose path was re-added, kept until rotation
+        self._fh = None
+        self._unsynced = 0
+        self._flush_event = threading.Event()
+        self._replay()
+        # Nothing is encoding yet, so adds held behind an interrupted encode can go
+        for path in list(self._held):
+            self._put(self._held.pop(path))
+        self._rehash_legacy()
+        self._rewrite()
+        threading.Thread(target=self._flusher, daemon=True).start()
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            self._import_legacy()
+            return
+        with open(self.path, "r") as f:
+            for lineno, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    self._apply(record)
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    # A torn last line after a crash is expected; skip it
+                    logger.warning(f"[STORE] Skipping unreadable journal line {lineno}")
+
+    def _import_legacy(self):
+        """ Seeds the store from an old-style conf/tasks.json array """
+        if not os.path.exists(TASKS_FILE):
+            return
+        try:
+            with open(TASKS_FILE, "r") as f:
+                for task in json.load(f):
+                    self._apply({"op": "add", "path": task["path"], "fields": task})
+            logger.info(f"[STORE] Imported {len(self._by_path)} tasks from {TASKS_FILE}")
+        except (json.JSONDecodeError, OSError, KeyError, TypeError):
+            logger.error("JSON file corrupted or unreadable. Starting with empty store.")
+
+    def _rehash_legacy(self):
+        """
+        Re-hashes tasks whose digest came from another algorithm (MD5 in older
+        versions, or BLAKE2b/BLAKE3 depending on the installed wheel), so their
+        files are still recognised. Only files still at their path with the
+        recorded size are re-hashed.
+        """
+        count = 0
+        for task in self._by_path.values():
+            if task.get("hash") == _HASH_NAME:
+                continue
+            abs_path = os.path.join(INPUT_DIR, task["path"])
+            size = file_size(abs_path)
+            if not size or size != task.get("file_size_before"):
+                continue
+            digest = fast_hash(abs_path)
+            if not digest:
+                continue
+            self._unindex_hash(task)
+            task["md5"] = digest
+            task["hash"] = _HASH_NAME
+            self._by_hash[digest] = task
+            count += 1
+        if count:
+            logger.info(f"[STORE] Re-hashed {count} tasks with {_HASH_NAME}")
+
+    def _apply(self, record):
+        path = record["path"]
+        fields = record["fields"]
+        task = self._by_path.get(path)
+        if record["op"] == "add":
+            if task and task.get("status") == "processing":
+                self._hold(path, fields)
+            else:
+                self._put(fields)
+            return
+        if task is None or ("md5" in record and record["md5"] != task.get("md5")):
+            return  # The path was re-added with other content since
+        if "md5" in fields:
+            self._unindex_hash(task)
+        task.update(fields)
+        if "md5" in task:
+            self._by_hash[task["md5"]] = task
+        if "status" in fields and task["status"] in QUEUED_STATUSES:
+            self._queue.append(path)
+        if task.get("status") != "processing" and path in self._held:
+            self._put(self._held.pop(path))
+
+    def _put(self, fields):
+        """ Stores a task, retiring or replacing any task for its path """
+        path = fields["path"]
+        old = self._by_path.get(path)
+        if old and old.get("status") not in QUEUED_STATUSES:
+            self._retired.append(old)
+        elif old:
+            # Never encoded and its content is gone
+            self._unindex_hash(old)
+        # Re-adding a path moves it to the back of the queue
+        task = self._by_path[path] = dict(fields)
+        if "md5" in task:
+            self._by_hash[task["md5"]] = task
+        if task.get("status") in QUEUED_STATUSES:
+            self._queue.append(path)
+
+    def _hold(self, path, fields):
+        """ Parks an add for a path that is processing; a later add replaces it """
+        held = self._held.get(path)
+        if held:
+            self._unindex_hash(held)
+        task = self._held[path] = dict(fields)
+        if "md5" in task:
+            self._by_hash[task["md5"]] = task
+
+    def _unindex_hash(self, task):
+        if self._by_hash.get(task.get("md5")) is task:
+            del self._by_hash[task["md5"]]
+
+    def _remove(self, path):
+        task = self._by_path.pop(path, None)
+        if task:
+            self._unindex_hash(task)
+
+    def _rewrite(self):
+        """ Replaces the journal with one "add" record per live task """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_file = self.path + ".tmp"
+        with open(temp_file, "w") as f:
+            # Before the live tasks, so replay retires them again
+            for task in self._retired:
+                f.write(json.dumps({"op": "add", "path": task["path"], "fields": task}) + "\n")
+            for path, task in self._by_path.items():
+                f.write(json.dumps({"op": "add", "path": path, "fields": task}) + "\n")
+            # After the processing task they wait for, so replay holds them again
+            for path, task in self._held.items():
+                f.write(json.dumps({"op": "add", "path": path, "fields": task}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        # Atomic move prevents corruption if power fails during write
+        os.replace(temp_file, self.path)
+        if self._fh:
+            self._fh.close()
+        self._fh = open(self.path, "a")
+        self._unsynced = 0
+
+    def _append(self, record):
+        """ Applies and journals a record. Caller holds data_lock for writing """
+        self._apply(record)
+        self._fh.write(json.dumps(record) + "\n")
+        self._fh.flush()
+        self._unsynced += 1
+        if self._unsynced >= FSYNC_BATCH:
+            self._flush_event.set()
+
+    def _flusher(self):
+        while True:
+            self._flush_event.wait(FSYNC_INTERVAL_MS / 1000)
+            self._flush_event.clear()
+            self.commit()
+
+    def commit(self):
+        """ fsyncs every record written so far """
+        with data_lock.write():
+            if not self._unsynced:
+                return
+            self._unsynced = 0
+            fh = self._fh
+        try:
+            os.fsync(fh.fileno())
+        except ValueError:
+            pass  # Compacted meanwhile; _rewrite already synced the new journal
+        except OSError as e:
+            logger.error(f"Failed to sync task journal: {e}")
+
+    def add_many(self, tasks):
+        """
+        Journals several new tasks under a single lock acquire.
+        Tasks whose hash is already known are skipped; returns the ones added.
+        """
+        added = []
+        with data_lock.write():
+            for task in tasks:
+                if task["md5"] in self._by_hash:
+                    continue
+                self._append({"op": "add", "path": task["path"], "fields": task})
+                added.append(task)
+        return added
+
+    def update(self, path, fields, md5=None):
+        """ Updates the task for path; with md5, only if it still holds that content """
+        record = {"op": "update", "path": path, "fields": fields}
+        if md5 is not None:
+            record["md5"] = md5
+        with data_lock.write():
+            self._append(record)
+
+    def get(self, path):
+        with data_lock.read():
+            task = self._by_path.get(path)
+            return dict(task) if task else None
+
+    def next_queued(self):
+        """ Copy of the oldest task waiting to be processed, or None """
+        with data_lock.write():
+            while self._queue:
+                task = self._by_path.get(self._queue[0])
+                if task and task["status"] in QUEUED_STATUSES:
+                    return dict(task)
+                # Started, finished or rotated away since it was queued
+                self._queue.popleft()
+        return None
+
+    def has_hash(self, digest):
+        with data_lock.read():
+            return digest in self._by_hash
+
+    def snapshot(self):
+        with data_lock.read():
+            return [dict(t) for t in self._retired] + [dict(t) for t in self._by_path.values()]
+
+    def compact(self, drop=()):
+        """
+        Drops the given (path, md5) tasks and rewrites the journal from what is left.
+        A path re-added with other content since keeps its new task.
+        """
+        drop = set(drop)
+        with data_lock.write():
+            for path, md5 in drop:
+                task = self._by_path.get(path)
+                if task and task.get("md5") == md5:
+                    self._remove(path)
+            retired = []
+            for task in self._retired:
+                if (task["path"], task.get("md5")) in drop:
+                    self._unindex_hash(task)
+                else:
+                    retired.append(task)
+            self._retired = retired
+            self._rewrite()
+
+store = None
+
 # ===================================================
 # TASK ROTATION
 # ===================================================
@@ -188,64 +691,57 @@ def rotate_tasks():
     Archives old tasks when rotation conditions are met:
     - Error tasks go to conf/tasks-err.json.<date>
     - Processed tasks go to conf/tasks.json.<date>
-    - Clears the main tasks.json file
+    - Truncates the task journal
     """
-    tasks = load_tasks()
-    with data_lock:
-        if not tasks:
-            logger.info("[ROTATION] No tasks to rotate")
-            return
-        
-        timestamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
-        error_statuses = ["error_missing_input", "error_exception", "error_no_resolution", "failed"]
-        
-        # Separate tasks by status
-        error_tasks = [t for t in tasks if t.get("status") in error_statuses]
-        processed_tasks = [t for t in tasks if t.get("status") == "processed"]
-        
-        # Archive error tasks
-        if error_tasks:
-            error_file = f"conf/tasks-err.json.{timestamp}"
-            try:
-                with open(error_file, "w") as f:
-                    json.dump(error_tasks, f, indent=4)
-                logger.info(f"[ROTATION] Archived {len(error_tasks)} error tasks to {error_file}")
-                send_ntfy(f"📦 Archived {len(error_tasks)} error tasks")
-            except OSError as e:
-                logger.error(f"[ROTATION] Failed to save error archive: {e}")
-        
-        # Archive processed tasks
-        if processed_tasks:
-            processed_file = f"conf/tasks.json.{timestamp}"
-            try:
-                with open(processed_file, "w") as f:
-                    json.dump(processed_tasks, f, indent=4)
-                logger.info(f"[ROTATION] Archived {len(processed_tasks)} processed tasks to {processed_file}")
-                send_ntfy(f"📦 Archived {len(processed_tasks)} processed tasks")
-            except OSError as e:
-                logger.error(f"[ROTATION] Failed to save processed archive: {e}")
-        
-        # Clear main tasks file
-        tasks_clear = []
-        os.makedirs(os.path.dirname(TASKS_FILE), exist_ok=True)
-        temp_file = TASKS_FILE + ".tmp"
+    tasks = store.snapshot()
+    if not tasks:
+        logger.info("[ROTATION] No tasks to rotate")
+        return
+
+    timestamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+    error_statuses = ["error_missing_input", "error_exception", "error_no_resolution", "failed", "cancelled"]
+    
+    # Separate tasks by status
+    error_tasks = [t for t in tasks if t.get("status") in error_statuses]
+    processed_tasks = [t for t in tasks if t.get("status") == "processed"]
+    
+    # Archive error tasks
+    if error_tasks:
+        error_file = f"conf/tasks-err.json.{timestamp}"
         try:
-            with open(temp_file, "w") as f:
-                json.dump(tasks_clear, f, indent=4)
-            # Atomic move prevents corruption if power fails during write
-            os.replace(temp_file, TASKS_FILE)
-            logger.info(f"[ROTATION] Cleared tasks.json - Total archived: {len(tasks)}")
-            send_ntfy(f"🔄 Task rotation complete: {len(tasks)} total tasks archived")
+            with open(error_file, "w") as f:
+                json.dump(error_tasks, f, indent=4)
+            logger.info(f"[ROTATION] Archived {len(error_tasks)} error tasks to {error_file}")
+            send_ntfy(f"📦 Archived {len(error_tasks)} error tasks")
         except OSError as e:
-            logger.error(f"Failed to reset tasks file: {e}")
-            send_ntfy(f"🔄 Task rotation Failed: {len(tasks)} total tasks.")
+            logger.error(f"[ROTATION] Failed to save error archive: {e}")
+    
+    # Archive processed tasks
+    if processed_tasks:
+        processed_file = f"conf/tasks.json.{timestamp}"
+        try:
+            with open(processed_file, "w") as f:
+                json.dump(processed_tasks, f, indent=4)
+            logger.info(f"[ROTATION] Archived {len(processed_tasks)} processed tasks to {processed_file}")
+            send_ntfy(f"📦 Archived {len(processed_tasks)} processed tasks")
+        except OSError as e:
+            logger.error(f"[ROTATION] Failed to save processed archive: {e}")
+    
+    # Truncate the journal (tasks added since the snapshot are kept)
+    try:
+        store.compact(drop=[(t["path"], t.get("md5")) for t in tasks])
+        logger.info(f"[ROTATION] Cleared {TASKS_LOG} - Total archived: {len(tasks)}")
+        send_ntfy(f"🔄 Task rotation complete: {len(tasks)} total tasks archived")
+    except OSError as e:
+        logger.error(f"Failed to reset tasks file: {e}")
+        send_ntfy(f"🔄 Task rotation Failed: {len(tasks)} total tasks.")
 
 def check_and_rotate():
     """
     Checks if rotation should happen and performs it if conditions are met
     Called periodically by the processor loop
     """
-    tasks = load_tasks()
+    tasks = store.snapshot()
     
     if should_rotate_tasks(tasks):
         logger.info(f"[ROTATION] Conditions met: {len(tasks)} entries, no active tasks, {ROTATION_SCAN_WAIT} scans completed")
@@ -255,9 +751,10 @@ def check_and_rotate():
 # WATCHER LOGIC
 # ===================================================
 def wait_for_file_transfer(filepath):
-    """ Waits until file size stops changing (transfer complete) """
+    """ Waits until file size stops changing (transfer complete), backing off 0.25s -> 1s """
     last_size = -1
     stable_count = 0
+    delay = 0.25
     
     while stable_count < 3:
         try:
@@ -272,17 +769,38 @@ def wait_for_file_transfer(filepath):
             stable_count = 0
         
         if stable_count < 3:
-            time.sleep(1)
+            time.sleep(delay)
+            delay = min(delay * 2, 1)
             
     return True
 
-def add_task(rel_path):
+def file_settled(filepath):
+    """ True if the file is not empty and size and mtime stay unchanged for CLOSE_SETTLE seconds """
+    try:
+        before = os.stat(filepath)
+        time.sleep(CLOSE_SETTLE)
+        after = os.stat(filepath)
+    except FileNotFoundError:
+        return False
+    if after.st_size == 0:
+        return False
+    return (before.st_size, before.st_mtime_ns) == (after.st_size, after.st_mtime_ns)
+
+def _prepare_task(rel_path, wait=True):
+    """
+    Waits for the transfer, detects the resolution and hashes the file.
+    Returns a new task dict, or None if the file is skipped. Safe to run in parallel.
+    """
     abs_path = os.path.join(INPUT_DIR, rel_path)
     
-    # 1. Wait for copy to finish
-    if not wait_for_file_transfer(abs_path):
+    # 1. Wait for copy to finish. A closed file only needs a short settle check;
+    #    if it is reopened, the next close queues it again.
+    if wait and not wait_for_file_transfer(abs_path):
         logger.warning(f"File vanished or empty: {rel_path}")
-        return
+        return None
+    if not wait and not file_settled(abs_path):
+        logger.info(f"[WAIT] Empty or changed after close, waiting for the next close: {rel_path}")
+        return None
 
     # 2. Detect resolution from folder path
     resolution = detect_resolution_from_path(rel_path)
@@ -290,24 +808,24 @@ def add_task(rel_path):
     if resolution is None:
         logger.warning(f"[SKIP] File not in resolution folder (480/720/1080): {rel_path}")
         send_ntfy(f"⚠️ File skipped (not in resolution folder): {rel_path}")
-        return
+        return None
 
-    # 3. Check if already exists in memory or disk
-    tasks = load_tasks()
-    
-    # Calculate hash safely now that file is stable
+    # 3. Calculate hash safely now that file is stable
     f_hash = fast_hash(abs_path)
     size_before = file_size(abs_path)
 
     # Skip if we have seen this specific file content before
-    if any(t.get("md5") == f_hash for t in tasks):
+    if store.has_hash(f_hash):
         logger.info(f"[SKIP] Duplicate file content detected: {rel_path}")
-        return
+        return None
+
+    # Kept on the task so the encode needs no ffprobe, even after a restart
+    media = _probe_media(abs_path)
 
-    # Add new task
-    new_task = {
+    return {
         "path": rel_path,
         "md5": f_hash,
+        "hash": _HASH_NAME,
         "resolution": resolution,
         "status": "queued",
         "added_time": now(),
@@ -315,50 +833,223 @@ def add_task(rel_path):
         "end_time": "",
         "file_size_before": size_before,
         "file_size_after": 0,
-        "time_taken_seconds": 0
+        "time_taken_seconds": 0,
+        "duration": media["duration"],
+        "display_height": media["display_height"],
+        "audio_codec": media["audio_codec"]
     }
 
-    tasks.append(new_task)
-    save_tasks(tasks)
-    logger.info(f"[TASK ADDED] {rel_path} (Resolution: {resolution}p)")
-    send_ntfy(f"📁 New File Queued: {rel_path} ({resolution}p)")
+def _commit_tasks(new_tasks):
+    """ Journals prepared tasks in one go, dropping content that was queued meanwhile """
+    new_tasks = [t for t in new_tasks if t is not None]
+    added = store.add_many(new_tasks)
+    if len(added) < len(new_tasks):
+        added_paths = {t["path"] for t in added}
+        for task in new_tasks:
+            if task["path"] not in added_paths:
+                logger.info(f"[SKIP] Duplicate file content detected: {task['path']}")
+    for task in added:
+        current = store.get(task["path"])
+        if current and current["status"] == "processing":
+            # New content for the file being encoded; it is queued again once the encode stops
+            logger.warning(f"[CHANGED] Input replaced during encode, cancelling it: {task['path']}")
+            cancel_event.set()
+        logger.info(f"[TASK ADDED] {task['path']} (Resolution: {task['resolution']}p)")
+        send_ntfy(f"📁 New File Queued: {task['path']} ({task['resolution']}p)")
+
+def _prepare_task_safe(args):
+    """ _prepare_task for executor.map over (rel_path, wait) pairs """
+    rel_path, wait = args
+    try:
+        return _prepare_task(rel_path, wait)
+    except Exception as e:
+        logger.error(f"Failed to add task for {rel_path}: {e}")
+        return None
+
+def _iter_video_files(root):
+    """
+    Yields paths of all non-hidden video files below root. Uses an explicit
+    scandir stack so file types come from the directory listing, not a stat per entry.
+    """
+    stack = [root]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith(_VIDEO_SUFFIXES):
+                    yield entry.path
+
+def to_rel(path):
+    """ Path relative to INPUT_DIR, without os.path.relpath's normalisation work """
+    if path.startswith(_INPUT_PREFIX):
+        return path[len(_INPUT_PREFIX):]
+    return os.path.relpath(path, INPUT_DIR)
+
+_hash_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="hash")
+
+# Watcher events are coalesced per path: rel_path -> (deadline, wait)
+_pending = {}
+_pending_lock = threading.Lock()
+_pending_event = threading.Event()
+
+# Created files that have not reported a close yet: rel_path -> fallback deadline
+_unclosed = {}
+
+def queue_for_add(rel_path, wait=True):
+    """ Queues rel_path once no new event for it arrived for DEBOUNCE_MS """
+    with _pending_lock:
+        _unclosed.pop(rel_path, None)
+        _pending[rel_path] = (time.monotonic() + DEBOUNCE_MS / 1000, wait)
+    _pending_event.set()
+
+def mark_unclosed(rel_path):
+    """
+    Remembers a created file that its close event will queue. Files that never
+    report a close (hard links) go to size polling after CREATE_FALLBACK seconds.
+    """
+    with _pending_lock:
+        if rel_path not in _pending:
+            _unclosed[rel_path] = time.monotonic() + CREATE_FALLBACK
+    _pending_event.set()
+
+def _expire_unclosed(now_ts):
+    """ Moves unclosed files that saw no write for CREATE_FALLBACK to _pending. Caller holds _pending_lock """
+    for rel, deadline in list(_unclosed.items()):
+        if deadline > now_ts:
+            continue
+        try:
+            idle = time.time() - os.stat(os.path.join(INPUT_DIR, rel)).st_mtime
+        except OSError:
+            del _unclosed[rel]
+            continue
+        if idle < CREATE_FALLBACK:
+            # Still being written; its close will come
+            _unclosed[rel] = now_ts + CREATE_FALLBACK - idle
+        else:
+            del _unclosed[rel]
+            _pending[rel] = (now_ts, True)
+
+# Paths being prepared; a newer event for one waits in _pending so commits stay in order
+_in_flight = set()
+
+def _commit_prepared(rel_path, future):
+    """ Done-callback of a prepare future: journals its task as soon as it is ready """
+    try:
+        _commit_tasks([future.result()])
+    except Exception as e:
+        logger.error(f"Failed to add tasks: {e}")
+    finally:
+        with _pending_lock:
+            _in_flight.discard(rel_path)
+        _pending_event.set()
+
+def _debounce_worker():
+    while True:
+        with _pending_lock:
+            now_ts = time.monotonic()
+            _expire_unclosed(now_ts)
+            due = [(rel, w) for rel, (deadline, w) in _pending.items()
+                   if deadline <= now_ts and rel not in _in_flight]
+            for rel, _ in due:
+                del _pending[rel]
+                _in_flight.add(rel)
+            # In-flight paths are woken by their done-callback instead
+            deadlines = [d for rel, (d, _) in _pending.items() if rel not in _in_flight]
+            deadlines += _unclosed.values()
+            timeout = max(0, min(deadlines) - now_ts) if deadlines else None
+            _pending_event.clear()
+
+        # Each file is committed as soon as it is prepared, so a long transfer
+        # wait or probe does not hold back the files queued alongside it
+        for rel, wait in due:
+            future = _hash_pool.submit(_prepare_task_safe, (rel, wait))
+            future.add_done_callback(lambda f, rel=rel: _commit_prepared(rel, f))
+
+        # Woken early by queue_for_add when a new path arrives
+        _pending_event.wait(timeout)
 
 class Handler(FileSystemEventHandler):
-    def process(self, src_path):
+    def process(self, src_path, wait=True):
         # Ignore temp files or hidden files
         if os.path.basename(src_path).startswith("."):
             return
 
         if os.path.isdir(src_path):
-            for root, _, files in os.walk(src_path):
-                for f in files:
-                    if f.startswith("."): continue
-                    ext = os.path.splitext(f)[1].lower()
-                    if ext in VIDEO_EXT:
-                        rel = os.path.relpath(os.path.join(root, f), INPUT_DIR)
-                        add_task(rel)
-        else:
-            ext = os.path.splitext(src_path)[1].lower()
-            if ext in VIDEO_EXT:
-                rel = os.path.relpath(src_path, INPUT_DIR)
-                add_task(rel)
+            for path in _iter_video_files(src_path):
+                queue_for_add(to_rel(path), wait)
+        elif src_path.lower().endswith(_VIDEO_SUFFIXES):
+            queue_for_add(to_rel(src_path), wait)
 
     def on_created(self, event):
+        if CLOSE_EVENTS and not event.is_directory:
+            # Queued by its close event; mark_unclosed covers files that never close
+            name = os.path.basename(event.src_path)
+            if not name.startswith(".") and name.lower().endswith(_VIDEO_SUFFIXES):
+                mark_unclosed(to_rel(event.src_path))
+            return
+        # Files written before inotify watched a new folder never report a close,
+        # so new folders are walked with the size-polling fallback
         self.process(event.src_path)
+
+    def on_closed(self, event):
+        self.process(event.src_path, wait=False)
     
     def on_moved(self, event):
-        # Handle files moved into the folder
-        if not event.is_directory:
-            self.process(event.dest_path)
+        # Handle files moved into the folder. inotify also reports folders
+        # moved in from outside as moves, and their contents are complete
+        if CLOSE_EVENTS or not event.is_directory:
+            self.process(event.dest_path, wait=not CLOSE_EVENTS)
 
 def initial_scan():
     logger.info("[INIT] Scanning existing files...")
-    # Manual trigger of process logic for existing files
-    h = Handler()
-    h.process(INPUT_DIR)
+    paths = list(_iter_video_files(INPUT_DIR))
+    # Start readahead for the files the hash cache can't answer, before the hash workers get to them
+    prefetch_hash_windows([path for path in paths if not _hash_cached(path)])
+    _commit_tasks(_hash_pool.map(_prepare_task_safe, [(to_rel(path), True) for path in paths]))
+
+if CLOSE_EVENTS:
+    from watchdog.observers.api import BaseObserver, DEFAULT_OBSERVER_TIMEOUT
+    from watchdog.observers.inotify import InotifyFullEmitter
+    from watchdog.observers.inotify_c import InotifyConstants
+
+    class InputEmitter(InotifyFullEmitter):
+        """
+        inotify emitter that only asks the kernel for the events Handler uses
+        and drops everything else before it reaches the observer queue.
+        Being a "full" emitter, files moved in from outside the tree are
+        reported as moves rather than creations.
+        """
+        # IN_CREATE gives new subfolders a watch and catches hard-linked files
+        EVENT_MASK = (InotifyConstants.IN_CLOSE_WRITE | InotifyConstants.IN_MOVE |
+                      InotifyConstants.IN_CREATE | InotifyConstants.IN_DELETE_SELF)
+        EVENT_TYPES = (FileClosedEvent, FileMovedEvent, FileCreatedEvent,
+                       DirMovedEvent, DirCreatedEvent)
+
+        def get_event_mask_from_filter(self):
+            return self.EVENT_MASK
+
+        def queue_event(self, event):
+            if event.is_synthetic and isinstance(event, (FileCreatedEvent, DirCreatedEvent)):
+                # Synthesized for the contents of a moved folder, which Handler walks itself
+                return
+            if isinstance(event, self.EVENT_TYPES):
+                super().queue_event(event)
+
+    class InputObserver(BaseObserver):
+        def __init__(self, *, timeout=DEFAULT_OBSERVER_TIMEOUT):
+            super().__init__(InputEmitter, timeout=timeout)
 
 def start_watcher():
-    observer = Observer()
+    threading.Thread(target=_debounce_worker, daemon=True).start()
+
+    observer = InputObserver() if CLOSE_EVENTS else Observer()
     observer.schedule(Handler(), INPUT_DIR, recursive=True)
     observer.start()
     logger.info("[WATCHER] Service started")
@@ -372,6 +1063,20 @@ def start_watcher():
 # ===================================================
 # PROCESSOR LOGIC
 # ===================================================
+if _parse_progress is None:
+    def _parse_progress(buf):
+        """ Newest out_time_us in buf (complete lines only), or -1 """
+        i = buf.rfind(b"out_time_us=")
+        if i < 0:
+            return -1
+        try:
+            return int(buf[i + 12:buf.index(b"\n", i)])
+        except ValueError:
+            return -1  # "N/A" before the first frame
+
+# Set to abort the running encode (ffmpeg is terminated, the task ends as cancelled)
+cancel_event = threading.Event()
+
 def process_video(task):
     x = X265_PROFILES[PROFILE]
     in_path = os.path.join(INPUT_DIR, task["path"])
@@ -379,7 +1084,7 @@ def process_video(task):
     
     if not os.path.exists(in_path):
         logger.error(f"Input file missing: {in_path}")
-        task["status"] = "error_missing_input"
+        store.update(task["path"], {"status": "error_missing_input"}, task["md5"])
         return
 
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
@@ -389,121 +1094,155 @@ def process_video(task):
     logger.info(f"[STARTED] {task['path']} (Resolution: {resolution}p)")
 
     start_ts = time.time()
+    cancel_event.clear()
 
-    # Get duration for progress calculation
-    duration = 0
-    try:
-        probe = subprocess.check_output(
-            ["ffprobe", "-v", "error", "-show_entries", "format=duration",
-             "-of", "default=noprint_wrappers=1:nokey=1", in_path]
-        )
-        duration = float(probe.strip())
-    except Exception as e:
-        logger.warning(f"Could not probe duration: {e}")
-
-    cmd = [
-        "ffmpeg", "-i", in_path,
-        "-vf", f"scale=-2:{resolution}",
-        "-c:v", "libx265",
-        "-preset", x["preset"],
-        "-x265-params", x["params"],
-        "-crf", x["crf"],
-        "-c:a", "aac",
-        "-b:a", "128k",
-        out_path,
-        "-y"
-    ]
+    # Probed at ingestion; only tasks from older versions need ffprobe here
+    if "display_height" in task and "audio_codec" in task:
+        media = task
+    else:
+        media = _probe_media(in_path)
+    # Duration for progress calculation, probed at ingestion when possible
+    duration = task.get("duration") or media["duration"]
+
+    # Only downscale; a source already at or below the target keeps its size
+    if media["display_height"] and media["display_height"] <= int(resolution):
+        scale_args = []
+    else:
+        scale_args = ["-vf", f"scale=-2:{resolution}"]
+
+    # AAC input is already in the target codec, so skip the re-encode
+    if media["audio_codec"] == "aac":
+        audio_args = ["-c:a", "copy"]
+    else:
+        audio_args = ["-c:a", "aac", "-b:a", "128k"]
 
     try:
-        process = subprocess.Popen(
-            cmd,
-            stderr=subprocess.PIPE,
-            stdout=subprocess.DEVNULL,
-            text=True
-        )
+        # ffmpeg writes structured key=value progress to its own pipe, so only
+        # a few short lines per second reach Python and stderr carries errors only
+        r, w = os.pipe()
+        cmd = [
+            "ffmpeg",
+            "-progress", f"pipe:{w}",
+            "-nostats", "-loglevel", "error",
+            "-i", in_path,
+            *scale_args,
+            "-c:v", "libx265",
+            "-preset", x["preset"],
+            "-x265-params", x["params"],
+            "-crf", x["crf"],
+            *audio_args,
+            out_path,
+            "-y"
+        ]
 
-        # Read progress
-        while True:
-            line = process.stderr.readline()
-            if not line and process.poll() is not None:
-                break
-            
-            if duration > 0:
-                match = re.search(r"time=(\d+:\d+:\d+\.\d+)", line)
-                if match:
-                    t = match.group(1)
-                    try:
-                        h, m, s = t.split(":")
-                        elapsed = int(h)*3600 + int(m)*60 + float(s)
-                        pct = min(100, (elapsed / duration) * 100)
-                        # Print carriage return only to update line in place
-                        print(f"\r[FFMPEG] {pct:5.1f}% - {task['path']}", end="")
-                    except:
-                        pass
+        with selectors.DefaultSelector() as sel:
+            try:
+                process = subprocess.Popen(cmd, pass_fds=(w,), stdout=subprocess.DEVNULL)
+            except Exception:
+                os.close(r)
+                raise
+            finally:
+                os.close(w)
+
+            # Wait with a timeout so cancellation and stalls are noticed between updates
+            sel.register(r, selectors.EVENT_READ)
+            buf = b""
+            next_print = 0
+            last_data = time.monotonic()
+            stalled = False
+            cancelled = False
+            try:
+                while True:
+                    ready = sel.select(timeout=1.0)
+                    if cancel_event.is_set():
+                        cancelled = True
+                        process.terminate()
+                        break
+                    if not ready:
+                        if not stalled and time.monotonic() - last_data > STALL_TIMEOUT:
+                            logger.warning(f"[STALLED] No progress from ffmpeg for {STALL_TIMEOUT}s: {task['path']}")
+                            stalled = True
+                        continue
+
+                    data = os.read(r, 4096)
+                    if not data:
+                        break
+                    last_data = time.monotonic()
+                    stalled = False
+
+                    # Parse complete lines only, a partial one waits for the next read
+                    buf += data
+                    end = buf.rfind(b"\n") + 1
+                    if not end:
+                        continue
+                    lines, buf = buf[:end], buf[end:]
+                    if duration <= 0 or last_data < next_print:
+                        continue
+                    out_time_us = _parse_progress(lines)
+                    if out_time_us < 0:
+                        continue
+                    pct = min(100, (out_time_us / 1e6 / duration) * 100)
+                    # Print carriage return only to update line in place
+                    print(f"\r[FFMPEG] {pct:5.1f}% - {task['path']}", end="")
+                    next_print = last_data + PROGRESS_INTERVAL
+            finally:
+                os.close(r)
         
         print() # Newline after progress bar
         
-        return_code = process.poll()
+        return_code = process.wait()
         end_ts = time.time()
 
-        if return_code == 0:
-            task["status"] = "processed"
-            task["end_time"] = now()
-            task["file_size_after"] = file_size(out_path)
-            task["time_taken_seconds"] = round(end_ts - start_ts, 2)
+        if cancelled:
+            # New content arrived for this path; its task is queued once this one leaves processing
+            store.update(task["path"], {"status": "cancelled", "end_time": now()}, task["md5"])
+            logger.warning(f"[RESTARTING] Input changed during encode: {task['path']}")
+            send_ntfy(f"🔁 Restarting (input changed): {task['path']}")
+        elif return_code == 0:
+            store.update(task["path"], {
+                "status": "processed",
+                "end_time": now(),
+                "file_size_after": file_size(out_path),
+                "time_taken_seconds": round(end_ts - start_ts, 2)
+            }, task["md5"])
             send_ntfy(f"🟢 Finished: {task['path']} ({resolution}p)")
             logger.info(f"[FINISHED] {task['path']}")
         else:
-            task["status"] = "failed"
+            store.update(task["path"], {"status": "failed"}, task["md5"])
             logger.error(f"[FAILED] FFmpeg return code {return_code} for {task['path']}")
             send_ntfy(f"🔴 Failed: {task['path']}")
 
     except Exception as e:
         logger.error(f"Exception during processing: {e}")
-        task["status"] = "error_exception"
+        store.update(task["path"], {"status": "error_exception"}, task["md5"])
 
 def processor_loop():
     logger.info("[PROCESSOR] Service started")
     scan_counter = 0
     while True:
         try:
-            tasks = load_tasks()
-            task_to_run = None
+            # Oldest queued task, an O(1) check when idle
+            task_to_run = store.next_queued()
             
-            # Find next task safely
-            for task in tasks:
-                if task["status"] in ["queued", "waiting_for_resolution"]:
-                    # Ensure resolution is set
-                    if not task.get("resolution"):
-                        # Try to detect from path
-                        resolution = detect_resolution_from_path(task["path"])
-                        if resolution:
-                            task["resolution"] = resolution
-                        else:
-                            logger.error(f"Cannot determine resolution for {task['path']}")
-                            task["status"] = "error_no_resolution"
-                            continue
-                    
-                    task_to_run = task
-                    break
+            if task_to_run and not task_to_run.get("resolution"):
+                # Try to detect from path
+                resolution = detect_resolution_from_path(task_to_run["path"])
+                if resolution:
+                    task_to_run["resolution"] = resolution
+                    store.update(task_to_run["path"], {"resolution": resolution}, task_to_run["md5"])
+                else:
+                    logger.error(f"Cannot determine resolution for {task_to_run['path']}")
+                    store.update(task_to_run["path"], {"status": "error_no_resolution"}, task_to_run["md5"])
+                    continue
             
             if task_to_run:
-                # Mark as processing IMMEDIATELY inside the lock to prevent re-selection
-                task_to_run["status"] = "processing"
-                task_to_run["start_time"] = now()
-                save_tasks(tasks) # Save state before starting work
+                # Mark as processing IMMEDIATELY to prevent re-selection
+                start_time = now()
+                store.update(task_to_run["path"], {"status": "processing", "start_time": start_time}, task_to_run["md5"])
+                task_to_run["start_time"] = start_time
                 
-                # Do the heavy work outside the lock
+                # Do the heavy work; the result is journaled by process_video
                 process_video(task_to_run)
-                
-                # Re-load tasks to save the result (in case new tasks came in while processing)
-                # We need to find the specific task object again in the fresh list
-                current_tasks = load_tasks()
-                for t in current_tasks:
-                    if t["path"] == task_to_run["path"] and t["md5"] == task_to_run["md5"]:
-                        t.update(task_to_run) # Update fields
-                        break
-                save_tasks(current_tasks)
             else:
                 # No active tasks - increment scan counter and check rotation
                 scan_counter += 1
@@ -525,6 +1264,11 @@ if __name__ == "__main__":
     os.makedirs(INPUT_DIR, exist_ok=True)
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     os.makedirs("conf", exist_ok=True)
+
+    # The cache first, so re-hashing older tasks fills it for initial_scan
+    hash_cache = HashCache(HASH_CACHE_FILE)
+    store = TaskStore(TASKS_LOG)
+    threading.Thread(target=_ntfy_worker, daemon=True).start()
     
     # Create resolution subfolders
     for res in RESOLUTION_FOLDERS:
@@ -545,3 +1289,5 @@ if __name__ == "__main__":
             time.sleep(1)
     except KeyboardInterrupt:
         logger.info("Stopping services...")
+        store.commit()
+        hash_cache.close()
@@ -0,0 +1,45 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Optional C version of app._parse_progress, used when built with:
+
+    cythonize -i progress_parse.pyx
+"""
+from libc.stdlib cimport strtoll
+
+cdef extern from "string.h" nogil:
+    void *memmem(const void *haystack, size_t haystacklen,
+                 const void *needle, size_t needlelen)
+
+cdef const char *KEY = b"out_time_us="
+cdef size_t KEY_LEN = 12
+
+
+cdef inline long long _parse(const char *buf, Py_ssize_t n) noexcept nogil:
+    cdef const char *p = buf
+    cdef const char *last = NULL
+    cdef const char *hit
+    cdef char *end
+    cdef long long value
+
+    # Keep the last match; ffmpeg reports in order, so it is the newest
+    while True:
+        hit = <const char *>memmem(p, <size_t>(n - (p - buf)), KEY, KEY_LEN)
+        if hit == NULL:
+            break
+        last = hit
+        p = hit + KEY_LEN
+    if last == NULL:
+        return -1
+
+    # buf holds complete lines only, so strtoll stops at the newline at the latest
+    value = strtoll(last + KEY_LEN, &end, 10)
+    if end == last + KEY_LEN:
+        return -1  # "N/A" before the first frame
+    return value
+
+
+def parse_progress(const unsigned char[::1] buf):
+    """ Newest out_time_us in buf (complete lines only), or -1 """
+    if buf.shape[0] == 0:
+        return -1
+    return _parse(<const char *>&buf[0], buf.shape[0])